@@ -1,29 +1,148 @@
-from autograd import elementwise_grad
+import math
 
-import autograd.numpy as anp
-import autograd.scipy.special as sp
+import numpy as np
+from scipy.special import ndtr
+
+# ndtr evaluates the standard normal CDF directly in C: faster than composing it from erf
+# (or approximating erf with a polynomial), and accurate far out into the tails.
+normal_cdf = ndtr
+
+def normal_pdf(x):
+    return np.exp(-np.square(x) / 2) / math.sqrt(2 * math.pi)
+
+class _lazy_property:
+    """Like functools.cached_property, without its per-instance lock (before Python 3.12),
+    which costs more than the scalar arithmetic it guards."""
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __get__(self, obj, cls=None):
+        # Stored in the instance dict, which takes precedence over this (non-data) descriptor
+        value = obj.__dict__[self.name] = self.func(obj)
+        return value
+
+
+class _BlackScholes:
+    """The Black Scholes model at one set of parameters (scalars or arrays).
+
+    Intermediate values are computed on first use and then shared, so each quantity
+    only pays for the terms it needs.
+    Units match the pricing function: time is in days and volatility is annualized in percent.
+    """
+
+    # Elementary functions the formulas are written in, overridden by _ScalarBlackScholes
+    _sqrt = staticmethod(np.sqrt)
+    _log = staticmethod(np.log)
+    _exp = staticmethod(np.exp)
+    _cdf = staticmethod(normal_cdf)
+    _pdf = staticmethod(normal_pdf)
+
+    def __init__(self, strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+        self.strike_price = strike_price
+        self.days_to_expiry = days_to_expiry
+        self.stock_price = stock_price
+        self.interest_rate = interest_rate
+        # Convert annualized volatility in percent to daily vol
+        self.volatility = volatility / math.sqrt(365.25) / 100
+        self.sqrt_time = self._sqrt(days_to_expiry)
+
+    @_lazy_property
+    def d1(self):
+        return (self._log(self.stock_price / self.strike_price)
+                + (self.interest_rate + self.volatility * self.volatility / 2) * self.days_to_expiry
+                ) / (self.volatility * self.sqrt_time)
+
+    @_lazy_property
+    def d2(self):
+        return self.d1 - self.volatility * self.sqrt_time
+
+    @_lazy_property
+    def discount(self):
+        return self._exp(-self.interest_rate * self.days_to_expiry)
+
+    @_lazy_property
+    def cdf_d1(self):
+        return self._cdf(self.d1)
+
+    @_lazy_property
+    def cdf_d2(self):
+        return self._cdf(self.d2)
+
+    @_lazy_property
+    def pdf_d1(self):
+        return self._pdf(self.d1)
+
+    def call_price(self):
+        # Black Scholes Formula
+        return self.stock_price * self.cdf_d1 - self.strike_price * self.discount * self.cdf_d2
+
+    def put_price(self):
+        return self.strike_price * self.discount - self.stock_price + self.call_price()
+
+    # The Options Greeks (of the call option), in closed form.
+    def delta(self):
+        return self.cdf_d1
+
+    def gamma(self):
+        return self.pdf_d1 / (self.stock_price * self.volatility * self.sqrt_time)
+
+    def theta(self):
+        # Change in price as one day passes, i.e. the negative of the derivative w.r.t. days_to_expiry
+        return -(self.stock_price * self.pdf_d1 * self.volatility / (2 * self.sqrt_time)
+                 + self.interest_rate * self.strike_price * self.discount * self.cdf_d2)
+
+    def vega(self):
+        # Derivative w.r.t. the annualized percent volatility, hence the unit conversion factor
+        return self.stock_price * self.pdf_d1 * self.sqrt_time / math.sqrt(365.25) / 100
+
+
+class _ScalarBlackScholes(_BlackScholes):
+    """The same model for Python float parameters, evaluated with the math module.
+
+    For a single point NumPy's per-call dispatch costs far more than the arithmetic.
+    """
+
+    _sqrt = staticmethod(math.sqrt)
+    _log = staticmethod(math.log)
+    _exp = staticmethod(math.exp)
+
+    @staticmethod
+    def _cdf(x):
+        return (1 + math.erf(x / math.sqrt(2))) / 2
+
+    @staticmethod
+    def _pdf(x):
+        return math.exp(-x * x / 2) / math.sqrt(2 * math.pi)
 
-def normal_cdf(x):
-    return (1 + sp.erf(x / anp.sqrt(2))) / 2
 
 def call_price(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
-    # Convert annualized volatility in percent to daily vol
-    volatility = volatility / anp.sqrt(365.25) / 100
-    sqrt_time = anp.sqrt(days_to_expiry)
-    d1 = (anp.log(stock_price / strike_price)
-          + (interest_rate + anp.square(volatility) / 2) * days_to_expiry) / (volatility * sqrt_time)
-    d2 = d1 - volatility * sqrt_time
-    # Black Scholes Formula
-    return (stock_price * normal_cdf(d1)
-            - strike_price * anp.exp(-interest_rate * days_to_expiry) * normal_cdf(d2))
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).call_price()
 
 def put_price(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
-    return strike_price * anp.exp(-interest_rate * days_to_expiry) - stock_price + \
-            call_price(strike_price, days_to_expiry, stock_price, interest_rate, volatility)
-
-# The Options Greeks
-delta = elementwise_grad(call_price, argnum=2)
-gamma = elementwise_grad(delta, argnum=2)
-_theta_grad = elementwise_grad(call_price, argnum=1)
-theta = lambda *args: -_theta_grad(*args)
-vega = elementwise_grad(call_price, argnum=4)
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).put_price()
+
+def delta(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).delta()
+
+def gamma(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).gamma()
+
+def theta(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).theta()
+
+def vega(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+    return _BlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility).vega()
+
+def all_greeks(strike_price, days_to_expiry, stock_price, interest_rate, volatility):
+    """Computes the option prices and all the greeks for a single (scalar) set of parameters."""
+    model = _ScalarBlackScholes(strike_price, days_to_expiry, stock_price, interest_rate, volatility)
+    return {
+        "call_price": model.call_price(),
+        "put_price": model.put_price(),
+        "delta": model.delta(),
+        "gamma": model.gamma(),
+        "theta": model.theta(),
+        "vega": model.vega(),
+    }
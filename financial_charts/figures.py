@@ -0,0 +1,22 @@
+"""Helpers for Matplotlib figures drawn with edifice's plotting.Figure."""
+
+
+class PlotFunction:
+    """Hands plotting.Figure a plotting function that only changes when the plotted state does.
+
+    The Figure redraws whenever it receives a plotting function that doesn't compare equal
+    to the previous one. Calling this object with the state the plot depends on returns the
+    same function as long as that state is unchanged (so unrelated re-renders don't redraw),
+    and a new one when it changes.
+    """
+
+    def __init__(self, plot):
+        self._plot = plot
+        self._state = None
+        self._plot_fun = None
+
+    def __call__(self, state):
+        if self._plot_fun is None or state != self._state:
+            self._state = state
+            self._plot_fun = lambda ax: self._plot(ax)
+        return self._plot_fun
@@ -1,26 +1,32 @@
 import asyncio
+import concurrent.futures
 import datetime
 from dateutil import tz
 import functools
 import math
+import threading
+import time
 
 import edifice as ed
 from edifice.components import plotting
 import numpy as np
 import pandas as pd
-import yfinance as yf
 
 from . import black_scholes
+from . import figures
 
 
 # Helper functions to access Yahoo Finance data and cache results
 @functools.cache
 def get_ticker(stock):
+    # Imported when first needed (always from a worker thread), as in stock_charts.data_for_ticker
+    import yfinance as yf
     return yf.Ticker(stock)
 
 @functools.cache
 def get_last_close(stock):
-    return get_ticker(stock).info["regularMarketPreviousClose"]
+    # fast_info avoids fetching and decoding the full (large) info dictionary
+    return get_ticker(stock).fast_info["regularMarketPreviousClose"]
 
 @functools.cache
 def get_expiries(stock):
@@ -30,10 +36,34 @@ def get_expiries(stock):
 def get_option_chain(stock, expiry):
     return get_ticker(stock).option_chain(expiry)
 
+# Option chains of expiries the user hasn't picked yet are prefetched on a small dedicated pool,
+# so prefetches never queue ahead of fetches the user is waiting on (which use asyncio's
+# default executor), and Yahoo isn't sent dozens of requests at once.
+_prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+# Its threads aren't daemons, so on exit Python would download every queued chain before stopping.
+# Drop the queue first. A plain atexit hook runs too late (after the pool's workers are joined);
+# this is the hook concurrent.futures itself uses, and later registrations run first.
+threading._register_atexit(lambda: _prefetch_executor.shutdown(wait=False, cancel_futures=True))
+
+def get_implied_vols(option_chains):
+    """Maps strike price to implied volatility (in percent), for calls and for puts."""
+    return tuple(dict(zip(chain.strike.to_numpy(), chain.impliedVolatility.to_numpy() * 100))
+                 for chain in option_chains[:2])
+
+# Number of points on the x-axis of the option charts. The curves are smooth,
+# so this is plenty for the width of the chart.
+PLOT_POINTS = 100
+
+_ET = tz.gettz("ET")
+
+@functools.lru_cache(maxsize=256)
+def _expiry_timestamp(expiration):
+    # Options expire at market close on the expiration date
+    return datetime.datetime.strptime(expiration, "%Y-%m-%d").replace(
+        hour=16, minute=0, second=0, tzinfo=_ET).timestamp()
+
 def days_till_expiration(expiration):
-    return (datetime.datetime.now() - datetime.datetime.strptime(
-        expiration, "%Y-%m-%d").replace(
-            hour=16, minute=0, second=0, tzinfo=tz.gettz("ET"))).total_seconds()/(3600*24)
+    return (time.time() - _expiry_timestamp(expiration))/(3600*24)
 
 
 class OptionCharts(ed.Component):
@@ -46,6 +76,8 @@ class OptionCharts(ed.Component):
         self.expiry = ""
         self.strike_price = ""
         self.option_chain = None
+        # Implied vol lookup tables built from option_chain (see get_implied_vols)
+        self.implied_vols = None
         self.loading_option_chain = False
         self.option_type = "Call"
         self.days_to_maturity = -1
@@ -56,12 +88,45 @@ class OptionCharts(ed.Component):
         self.xaxis = "stock_price"
         self.yaxis = "option_price"
 
+        self._plot_function = figures.PlotFunction(self.plot)
+        # Pending prefetches of the current ticker's option chains, by expiry
+        self._prefetches = {}
+
     def get_option_chain(self, option_chains=None):
         option_chains = option_chains if option_chains is not None else self.option_chain
         option_type_index = 0 if self.option_type == "Call" else 1
         return option_chains[option_type_index]
 
+    def get_implied_vol(self, strike_price, implied_vols=None):
+        implied_vols = implied_vols if implied_vols is not None else self.implied_vols
+        option_type_index = 0 if self.option_type == "Call" else 1
+        implied_vol = implied_vols[option_type_index][float(strike_price)]
+        if math.isnan(implied_vol):
+            implied_vol = 1000.0
+        return implied_vol
+
+    async def fetch_option_chain(self, expiry):
+        """Fetches an option chain of the current ticker, reusing its prefetch if it has started."""
+        prefetch = self._prefetches.pop(expiry, None)
+        # A prefetch still waiting in the queue is cancelled: fetching directly is quicker.
+        if prefetch is not None and not prefetch.cancel():
+            try:
+                return await asyncio.wrap_future(prefetch)
+            except Exception:
+                pass  # Fetch again below, so that errors reach the user
+        ticker = self.ticker
+        return await asyncio.to_thread(lambda: get_option_chain(ticker, expiry))
+
+    def cancel_prefetches(self):
+        for prefetch in self._prefetches.values():
+            prefetch.cancel()
+        self._prefetches = {}
+
+    def will_unmount(self):
+        self.cancel_prefetches()
+
     async def ticker_changed(self, text):
+        self.cancel_prefetches()
         self.set_state(ticker=text, expiry="", expiries=[], strike_price="", option_chain=None,
                        loading_expiries=True, loading_option_chain=True)
         expiries = await asyncio.to_thread(lambda: get_expiries(text))
@@ -79,61 +144,63 @@ class OptionCharts(ed.Component):
         if text != self.ticker:
             return
         strike_price = self.get_option_chain(option_chain).strike.iloc[0]
-        implied_vol = self.get_option_chain(option_chain).impliedVolatility.iloc[0] * 100
-        if math.isnan(implied_vol):
-            implied_vol = 1000.0
-        self.set_state(expiries=expiries, option_chain=option_chain,
+        implied_vols = get_implied_vols(option_chain)
+        self.set_state(expiries=expiries, option_chain=option_chain, implied_vols=implied_vols,
                        expiry=expiries[0], strike_price=strike_price,
-                       implied_vol=implied_vol,
+                       implied_vol=self.get_implied_vol(strike_price, implied_vols),
                        stock_price=self.last_close_price,
                        loading_expiries=False, loading_option_chain=False)
 
+        # Switching expiries is likely, so fetch the remaining option chains in the background.
+        # get_option_chain caches them, and expiry_changed waits on a prefetch that is under way.
+        self._prefetches = {expiry: _prefetch_executor.submit(get_option_chain, text, expiry)
+                            for expiry in expiries[1:]}
+
     async def expiry_changed(self, text):
         if text:
             self.set_state(expiry=text, loading_option_chain=True)
-            option_chain = await asyncio.to_thread(lambda: get_option_chain(self.ticker, text))
+            option_chain = await self.fetch_option_chain(text)
             if text != self.expiry:
                 return
-            implied_vol = self.get_option_chain(option_chain).impliedVolatility.iloc[0] * 100
-            if math.isnan(implied_vol):
-                implied_vol = 1000.0
-            self.set_state(option_chain=option_chain,
-                           strike_price=self.get_option_chain(option_chain).strike.iloc[0],
-                           implied_vol=implied_vol,
+            strike_price = self.get_option_chain(option_chain).strike.iloc[0]
+            implied_vols = get_implied_vols(option_chain)
+            self.set_state(option_chain=option_chain, implied_vols=implied_vols,
+                           strike_price=strike_price,
+                           implied_vol=self.get_implied_vol(strike_price, implied_vols),
                            loading_option_chain=False,
                            days_to_maturity=days_till_expiration(text))
 
     def strike_changed(self, text):
-        option_chain = self.get_option_chain()
-        cur_vol = option_chain[option_chain.strike == float(text)].impliedVolatility.iloc[0] * 100
         self.set_state(strike_price=text,
-                       implied_vol=cur_vol)
+                       implied_vol=self.get_implied_vol(text))
 
     def plot(self, ax):
         if not self.ticker or self.option_chain is None or self.strike_price == "":
             return
         cur_price = self.last_close_price
-        price_space = np.linspace(cur_price / 2, cur_price * 2, 200)
+        # Single precision is plenty for a chart and halves the memory traffic of the
+        # Black Scholes evaluation (see get_data for keeping it in float32).
+        price_space = np.linspace(cur_price / 2, cur_price * 2, PLOT_POINTS, dtype=np.float32)
         days_to_maturity = int(days_till_expiration(self.expiry))
-        maturity_space = np.linspace(days_to_maturity, -0.1, 200)
-        option_chain = self.get_option_chain()
-        cur_vol = option_chain[option_chain.strike == float(self.strike_price)].impliedVolatility.iloc[0] * 100
-        if math.isnan(cur_vol):
-            cur_vol = 1000.0
-        vol_space = np.linspace(cur_vol/2.0, cur_vol * 2.0, 200)
+        maturity_space = np.linspace(days_to_maturity, -0.1, PLOT_POINTS, dtype=np.float32)
+        cur_vol = self.get_implied_vol(self.strike_price)
+        vol_space = np.linspace(cur_vol/2.0, cur_vol * 2.0, PLOT_POINTS, dtype=np.float32)
 
         def get_data(name, xaxis):
+            # Scalar arguments are broadcast against the array by NumPy. They are float32
+            # scalars: float64 scalars (e.g. np.sqrt of a Python float) would promote the
+            # float32 grids to float64.
+            strike_price = np.float32(self.strike_price)
+            interest_rate = np.float32(0.01/365)
             if xaxis == "stock_price":
-                args = [float(self.strike_price), -self.days_to_maturity * np.ones_like(price_space),
-                        price_space, 0.01/365, self.implied_vol * np.ones_like(price_space)]
+                args = [strike_price, -np.float32(self.days_to_maturity),
+                        price_space, interest_rate, np.float32(self.implied_vol)]
             elif xaxis == "days_to_expiration":
-                args = [float(self.strike_price), -maturity_space,
-                        float(self.stock_price) * np.ones_like(maturity_space),
-                        0.01/365, self.implied_vol * np.ones_like(maturity_space)]
+                args = [strike_price, -maturity_space,
+                        np.float32(self.stock_price), interest_rate, np.float32(self.implied_vol)]
             elif xaxis == "implied_vol":
-                args = [float(self.strike_price), -self.days_to_maturity * np.ones_like(vol_space),
-                        float(self.stock_price) * np.ones_like(vol_space),
-                        0.01/365, vol_space]
+                args = [strike_price, -np.float32(self.days_to_maturity),
+                        np.float32(self.stock_price), interest_rate, vol_space]
             name_to_func = {
                 "delta": black_scholes.delta,
                 "gamma": black_scholes.gamma,
@@ -158,6 +225,13 @@ class OptionCharts(ed.Component):
 
         ax.plot(xdata, get_data(self.yaxis, self.xaxis))
 
+    def plot_fun(self):
+        """Returns the function to pass to plotting.Figure (see figures.PlotFunction)."""
+        plot_state = (self.ticker, self.expiry, self.option_type, self.strike_price,
+                      self.xaxis, self.yaxis, self.stock_price, self.days_to_maturity,
+                      self.implied_vol, self.last_close_price)
+        return self._plot_function(plot_state)
+
     def render(self):
         values = ["option_price", "delta", "gamma", "theta", "vega",]
         days_to_maturity = None
@@ -168,27 +242,15 @@ class OptionCharts(ed.Component):
                                and not self.loading_option_chain)
 
         if expiry_loaded and option_chain_loaded:
-            option_chain = self.get_option_chain()
-            implied_vol = option_chain[option_chain.strike == float(self.strike_price)].impliedVolatility.iloc[0] * 100
-            if math.isnan(implied_vol):
-                implied_vol = 1000.0
+            implied_vol = self.get_implied_vol(self.strike_price)
             args = [float(self.strike_price), -float(days_to_maturity),
                     float(self.last_close_price), 0.01 / 365, implied_vol]
-            greeks = {
-                "gamma": black_scholes.gamma(*args),
-                "theta": black_scholes.theta(*args),
-                "vega": black_scholes.vega(*args),
-            }
+            greeks = black_scholes.all_greeks(*args)
             if self.option_type == "Call":
-                greeks.update({
-                    "delta": black_scholes.delta(*args),
-                    "option_price": black_scholes.call_price(*args),
-                })
+                greeks["option_price"] = greeks["call_price"]
             else:
-                greeks.update({
-                    "delta": black_scholes.delta(*args) - 1,
-                    "option_price": black_scholes.put_price(*args),
-                })
+                greeks["delta"] -= 1
+                greeks["option_price"] = greeks["put_price"]
 
         return ed.View(style={"align": "top", "margin": 10})(
             ed.Label("Loading..." if self.loading_expiries or self.loading_option_chain else "",
@@ -249,5 +311,5 @@ class OptionCharts(ed.Component):
                     ed.Label(f"<b>Vega:</b> {greeks['vega']:.2f}\t"),
                 )
             ),
-            expiry_loaded and option_chain_loaded and plotting.Figure(plot_fun=lambda ax: self.plot(ax)),
+            expiry_loaded and option_chain_loaded and plotting.Figure(plot_fun=self.plot_fun()),
         )
@@ -16,16 +16,32 @@ import matplotlib.pyplot as plt
 from matplotlib.cm import get_cmap
 import numpy as np
 import pandas as pd
-import yfinance as yf
 import csv
 
+from . import figures
+
 plt.style.use('ggplot')
 
-TICKERS = pd.read_csv("nasdaqlisted.txt", sep="|").Symbol
+# The ticker list is read when first needed rather than at import time. That is still during
+# the first render (each AxisDescriptor builds a completer), so this cost only moves.
+@functools.cache
+def get_tickers():
+    return pd.read_csv("nasdaqlisted.txt", sep="|").Symbol
+
 
+# Price histories by ticker. Only non-empty histories are kept: yfinance returns an empty one
+# on a network error or for a partially typed ticker, and those should be fetched again.
+_histories = {}
 
 def data_for_ticker(ticker):
-    return yf.Ticker(ticker).history("1y")
+    df = _histories.get(ticker)
+    if df is None:
+        # Imported here, off the UI startup path: this only runs from the Figure's plot thread
+        import yfinance as yf
+        df = yf.Ticker(ticker).history("1y")
+        if not df.empty:
+            _histories[ticker] = df
+    return df
 
 
 def _create_state_for_plot(plotname):
@@ -71,6 +87,28 @@ TRANSFORMS = {
     "EMSTD": ("Half Life", lambda x, p: x.ewm(halflife=p).std()),
 }
 
+def _transform_data(df, label, transform, param):
+    if label == "Constant":
+        return np.ones_like(df.index)
+    if label == "Date":
+        return df.index
+    return TRANSFORMS[transform][1](df[label], param)
+
+# Transforms such as EMA are relatively expensive, and plots are re-rendered
+# on unrelated changes (e.g. the color map), so the results are memoized.
+# The returned data is shared and must not be mutated.
+@functools.lru_cache(maxsize=256)
+def _cached_data(ticker, label, transform, param):
+    return _transform_data(data_for_ticker(ticker), label, transform, param)
+
+def get_data(ticker, label, transform, param):
+    """Returns the data of the given type for ticker, after applying the transform."""
+    df = data_for_ticker(ticker)
+    # Like data_for_ticker, don't cache anything derived from an empty history
+    if df.empty:
+        return _transform_data(df, label, transform, param)
+    return _cached_data(ticker, label, transform, param)
+
 
 # We create a component which describes the options for each axis (data source, transform).
 # Since this component owns no state, we can simply write a render function and use the
@@ -85,7 +123,7 @@ def AxisDescriptor(self, name, key, children):
     transform_type, param = transform.value
     # We can use CSS styling. See https://www.pyedifice.org/styling.html
     row_style = {"align": "left", "width": 350}
-    completer = ed.Completer(TICKERS)
+    completer = ed.Completer(get_tickers())
     return View(layout="column")(
         View(layout="row", style=row_style)(
             Label(name, style={"width": 40}),
@@ -172,6 +210,10 @@ def PlotDescriptor(self, name, children):
 # To better organize the code, we create a class so that we can put plotting logic in methods.
 class StockCharts(ed.Component):
 
+    def __init__(self):
+        super().__init__()
+        self._plot_function = figures.PlotFunction(self.plot)
+
     # Adding a plot is very simple conceptually (and in Edifice).
     # Just add new state for the new plot!
     def add_plot(self, e):
@@ -186,13 +228,6 @@ class StockCharts(ed.Component):
     def plot(self, ax):
         all_plots = app_state["all_plots"]
 
-        def get_data(df, label, transform, param):
-            if label == "Constant":
-                return np.ones_like(df.index)
-            if label == "Date":
-                return df.index
-            return TRANSFORMS[transform][1](df[label], param)
-
         for plot in all_plots:
             plot_type = app_state.subscribe(self, f"{plot}.type").value
             color = app_state.subscribe(self, f"{plot}.colormap").value
@@ -204,21 +239,25 @@ class StockCharts(ed.Component):
                 axes = []
             else:
                 axes = ["yaxis"]
+            dfs = {}
             for axis in ["xaxis"] + axes:
                 data_descriptors[axis] = app_state.subscribe(self, f"{plot}.{axis}.data").value
                 transform_descriptors[axis] = app_state.subscribe(self, f"{plot}.{axis}.transform").value
-
-            dfs = {}
-            for axis in ["xaxis"] + axes:
                 dfs[axis] = data_for_ticker(data_descriptors[axis][1])
 
-            df = pd.DataFrame({"xaxis": get_data(dfs["xaxis"], data_descriptors["xaxis"][0], *transform_descriptors["xaxis"])},
-                              index=dfs["xaxis"].index)
+            def axis_data(axis):
+                data_type, ticker = data_descriptors[axis]
+                return get_data(ticker, data_type, *transform_descriptors[axis])
 
-            for axis in axes:
-                df = df.merge(pd.DataFrame({axis: get_data(dfs[axis], data_descriptors[axis][0], *transform_descriptors[axis])},
-                                           index=dfs[axis].index),
-                              left_index=True, right_index=True)
+            index = dfs["xaxis"].index
+            if all(dfs[axis].index is index for axis in axes):
+                # Same ticker (data_for_ticker is cached) so the data is already aligned
+                df = pd.DataFrame({axis: axis_data(axis) for axis in ["xaxis"] + axes}, index=index)
+            else:
+                # Different tickers: a single inner join on the dates
+                df = pd.concat([pd.DataFrame({axis: axis_data(axis)}, index=dfs[axis].index)
+                                for axis in ["xaxis"] + axes],
+                               axis=1, join="inner")
             df = df.dropna()
             if len(df) == 0:
                 return
@@ -226,13 +265,22 @@ class StockCharts(ed.Component):
             if plot_type == "line":
                 ax.plot(df.xaxis, df.yaxis, color=color)
             elif plot_type == "scatter":
-                min_size = np.min(df["size"])
-                max_size = np.max(df["size"])
-                df["size"] = 1 + 40 * (df["size"] - min_size) / (max_size - min_size)
+                # Rescale sizes to [1, 41] in place on a single float buffer.
+                # to_numeric maps dates to their integer timestamps.
+                size = pd.to_numeric(df["size"]).to_numpy(dtype=float, copy=True)
+                size -= size.min()
+                size *= 40.0 / size.max()
+                size += 1.0
+                df["size"] = size
                 ax.scatter(df.xaxis, df.yaxis, c=df.color, s=df["size"], cmap=get_cmap(color))
             elif plot_type == "histogram":
                 ax.hist(df.xaxis, bins=int(len(df.xaxis) / 20), color=color)
 
+    def plot_fun(self, all_plots):
+        """Returns the function to pass to plotting.Figure (see figures.PlotFunction)."""
+        plot_state = tuple(app_state[key] for plot in all_plots for key in _create_state_for_plot(plot))
+        return self._plot_function(plot_state)
+
     def render(self):
         all_plots = app_state.subscribe(self, "all_plots").value
         return View(layout="column", style={"margin": 10})(
@@ -241,7 +289,5 @@ class StockCharts(ed.Component):
             ),
             # Edifice comes with Font-Awesome icons for your convenience
             IconButton(name="plus", title="Add Plot", on_click=self.add_plot),
-            # We create a lambda fuction so that the method doesn't compare equal to itself.
-            # This forces re-renders everytime this entire component renders.
-            plotting.Figure(lambda ax: self.plot(ax)),
+            plotting.Figure(plot_fun=self.plot_fun(all_plots)),
         )